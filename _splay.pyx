@@ -0,0 +1,362 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Cython port of the splay tree kernels from rope_data_structure.py.
+
+It's an alternative to Numba, for environments where Numba isn't available.
+The rows of the nodes array are accessed as C structs, through a pointer,
+so splaying is made of plain loads and stores, without any Python objects, attribute lookups or function call overhead.
+The functions take the same arguments, in the same order, as their *_nb counterparts,
+and rope_data_structure.py uses them instead of the pure Python kernels if Numba is not installed.
+
+Build it in place, next to rope_data_structure.py:
+cythonize -i _splay.pyx
+"""
+
+from libc.stdlib cimport malloc, free
+
+import numpy as np
+
+
+cdef enum:
+    NIL = 0                                                     # index of the sentinel node; plays the role of None
+
+
+cdef struct Node:                                               # a row of the nodes array: LEFT, RIGHT and SIZE, in that order
+    int left
+    int right
+    int size
+
+
+cdef struct Tree:
+    Node* nodes
+    int* path                                                   # scratch space for splaying
+    Py_ssize_t pathLength
+
+
+cdef inline Tree _tree(int[:, ::1] nodes, int[::1] path):
+    cdef Tree t
+    t.nodes, t.path = <Node*> &nodes[0, 0], &path[0]
+    t.pathLength = path.shape[0]
+    return t
+
+
+cdef inline void _updateSize(Tree t, int node) noexcept nogil:
+    """Recomputes size of a node from sizes of its children."""
+    t.nodes[node].size = t.nodes[t.nodes[node].left].size + t.nodes[t.nodes[node].right].size + 1  # size of NIL is 0
+
+
+cdef int _orderStatistic(Tree t, int root, long long k) noexcept nogil:
+    cdef int node = root, y
+    cdef int lTail = NIL, rTail = NIL, lRoot = NIL, rRoot = NIL
+    cdef long long s
+    cdef Py_ssize_t lCount = 0, rEnd = t.pathLength, p
+    if root == NIL:
+        return NIL
+    while True:
+        s = t.nodes[t.nodes[node].left].size
+        if k < s:
+            y = t.nodes[node].left
+            if k < t.nodes[t.nodes[y].left].size:
+                # Zig-zig: rotate right
+                t.nodes[node].left = t.nodes[y].right
+                t.nodes[y].right = node
+                _updateSize(t, node)
+                node = y
+            # Link right
+            if rTail == NIL:
+                rRoot = node
+            else:
+                t.nodes[rTail].left = node
+            rTail = node
+            rEnd -= 1
+            t.path[rEnd] = node
+            node = t.nodes[node].left
+        elif k > s:
+            y = t.nodes[node].right
+            if k - s - 1 > t.nodes[t.nodes[y].left].size:
+                # Zig-zig: rotate left
+                t.nodes[node].right = t.nodes[y].left
+                t.nodes[y].left = node
+                _updateSize(t, node)
+                node = y
+            # Link left
+            k -= t.nodes[t.nodes[node].left].size + 1
+            if lTail == NIL:
+                lRoot = node
+            else:
+                t.nodes[lTail].right = node
+            lTail = node
+            t.path[lCount] = node
+            lCount += 1
+            node = t.nodes[node].right
+        else:
+            break
+
+    # Reassemble
+    if lTail != NIL:
+        t.nodes[lTail].right = t.nodes[node].left
+        t.nodes[node].left = lRoot
+    if rTail != NIL:
+        t.nodes[rTail].left = t.nodes[node].right
+        t.nodes[node].right = rRoot
+    for p in range(lCount - 1, -1, -1):                         # bottom-up
+        _updateSize(t, t.path[p])
+    for p in range(rEnd, t.pathLength):
+        _updateSize(t, t.path[p])
+    _updateSize(t, node)
+    return node
+
+
+cdef int _subtreeMaximum(Tree t, int node) noexcept nogil:
+    if node == NIL:
+        return NIL
+    return _orderStatistic(t, node, t.nodes[node].size - 1)
+
+
+cdef int _processFused(Tree t, int root, long long i, long long j, long long k) noexcept nogil:
+    cdef int leftRoot, rightRoot, middle, after
+
+    # Cut out the substring [i..j] as "middle".
+    if i > 0:
+        leftRoot = _orderStatistic(t, root, i - 1)
+        rightRoot = t.nodes[leftRoot].right
+        t.nodes[leftRoot].right = NIL
+    else:
+        leftRoot = NIL
+        rightRoot = root
+    if j - i + 1 < t.nodes[rightRoot].size:
+        rightRoot = _orderStatistic(t, rightRoot, j - i + 1)
+        middle = t.nodes[rightRoot].left
+        t.nodes[rightRoot].left = NIL
+        _updateSize(t, rightRoot)
+    else:
+        middle = rightRoot
+        rightRoot = NIL
+
+    # Link the rest; leftRoot has no right child, rightRoot has no left child.
+    if leftRoot != NIL:
+        t.nodes[leftRoot].right = rightRoot
+        _updateSize(t, leftRoot)
+        root = leftRoot
+    else:
+        root = rightRoot
+    if root == NIL:
+        return middle
+
+    # Paste "middle" after the k-th character of the rest.
+    if k > 0:
+        root = _orderStatistic(t, root, k - 1)
+        after = t.nodes[root].right
+        if after == NIL:
+            t.nodes[root].right = middle
+            _updateSize(t, root)
+            return root
+        after = _orderStatistic(t, after, 0)
+        t.nodes[after].left = middle
+        _updateSize(t, after)
+        t.nodes[root].right = after
+        _updateSize(t, root)
+        return root
+    root = _orderStatistic(t, root, 0)
+    t.nodes[root].left = middle
+    _updateSize(t, root)
+    return root
+
+
+def orderStatistic(int[:, ::1] nodes, int[::1] path, int root, long long k):
+    """See _orderStatistic_nb() in rope_data_structure.py."""
+    return _orderStatistic(_tree(nodes, path), root, k)
+
+
+def subtreeMaximum(int[:, ::1] nodes, int[::1] path, int node):
+    """See _subtreeMaximum_nb() in rope_data_structure.py."""
+    return _subtreeMaximum(_tree(nodes, path), node)
+
+
+def merge(int[:, ::1] nodes, int[::1] path, int root1, int root2):
+    """See _merge_nb() in rope_data_structure.py."""
+    cdef Tree t = _tree(nodes, path)
+    if root1 == NIL:
+        return root2
+    if root2 == NIL:
+        return root1
+    if t.nodes[root1].right != NIL:                             # otherwise, the root is already the maximum
+        root1 = _subtreeMaximum(t, root1)
+    t.nodes[root1].right = root2
+    _updateSize(t, root1)
+    return root1
+
+
+def split(int[:, ::1] nodes, int[::1] path, int root, long long rank):
+    """See _split_nb() in rope_data_structure.py."""
+    cdef Tree t = _tree(nodes, path)
+    cdef int root1 = _orderStatistic(t, root, rank), root2
+    root2 = t.nodes[root1].right
+    t.nodes[root1].right = NIL
+    _updateSize(t, root1)
+    return root1, root2
+
+
+def processFused(int[:, ::1] nodes, int[::1] path, int root, long long i, long long j, long long k):
+    """See _processFused_nb() in rope_data_structure.py."""
+    return _processFused(_tree(nodes, path), root, i, j, k)
+
+
+def processAll(int[:, ::1] nodes, int[::1] path, int root, const long long[:, ::1] ops):
+    """See _processAll_nb() in rope_data_structure.py."""
+    cdef Tree t = _tree(nodes, path)
+    cdef Py_ssize_t op
+    with nogil:
+        for op in range(ops.shape[0]):
+            root = _processFused(t, root, ops[op, 0], ops[op, 1], ops[op, 2])
+    return root
+
+
+def inOrder(int[:, ::1] nodes, int root, int[::1] ranked):
+    """See _inOrder_nb() in rope_data_structure.py."""
+    cdef Node* n = <Node*> &nodes[0, 0]
+    cdef Py_ssize_t top = 0, count = 0
+    cdef int current = root
+    cdef int* stack = <int*> malloc(max(ranked.shape[0], 1) * sizeof(int))  # stack contains nodes; it's never deeper than the tree
+    if stack == NULL:
+        raise MemoryError()
+    with nogil:
+        while True:
+            while current != NIL:
+                stack[top] = current
+                top += 1
+                current = n[current].left
+            if top == 0:
+                break
+            top -= 1
+            current = stack[top]
+            ranked[count] = current
+            count += 1
+            current = n[current].right
+    free(stack)
+
+
+def inOrderChunk(int[:, ::1] nodes, const unsigned char[::1] value, int[::1] stack, long long[::1] state, unsigned char[::1] buf):
+    """See _inOrderChunk_nb() in rope_data_structure.py."""
+    cdef Node* n = <Node*> &nodes[0, 0]
+    cdef Py_ssize_t top = state[0], count = 0
+    cdef int current = state[1]
+    with nogil:
+        while count < buf.shape[0]:
+            while current != NIL:
+                stack[top] = current
+                top += 1
+                current = n[current].left
+            if top == 0:
+                break
+            top -= 1
+            current = stack[top]
+            buf[count] = value[current]
+            count += 1
+            current = n[current].right
+    state[0], state[1] = top, current
+    return count
+
+
+def build(int[:, ::1] nodes, const int[::1] ranked):
+    """See _build_nb() in rope_data_structure.py."""
+    cdef Node* n = <Node*> &nodes[0, 0]
+    cdef Py_ssize_t num = ranked.shape[0], top = 1, lo, hi, mid
+    cdef Py_ssize_t stackLo[64]                                 # the depth of the tree is at most 32, and so is the stack
+    cdef Py_ssize_t stackHi[64]                                 # a range is [lo, hi)
+    cdef int node
+    if num == 0:
+        return NIL
+    stackLo[0], stackHi[0] = 0, num
+    with nogil:
+        while top > 0:
+            top -= 1
+            lo, hi = stackLo[top], stackHi[top]
+            mid = (lo + hi) // 2
+            node = ranked[mid]
+            n[node].size = hi - lo
+            if lo < mid:
+                n[node].left = ranked[(lo + mid) // 2]          # root of the left half is its middle node
+                stackLo[top], stackHi[top] = lo, mid
+                top += 1
+            else:
+                n[node].left = NIL
+            if mid + 1 < hi:
+                n[node].right = ranked[(mid + 1 + hi) // 2]
+                stackLo[top], stackHi[top] = mid + 1, hi
+                top += 1
+            else:
+                n[node].right = NIL
+    return ranked[num // 2]
+
+
+def relayout(int[:, ::1] nodes, unsigned char[::1] value, int root, int height):
+    """See _relayout_nb() in rope_data_structure.py."""
+    cdef Node* n = <Node*> &nodes[0, 0]
+    cdef Py_ssize_t num = n[root].size, blockSize = (1 << height) - 1
+    cdef int[::1] order = np.empty(num, dtype=np.int32)         # order[p] is the node that goes to index p + 1
+    cdef int[::1] blocks = np.empty(num + 1, dtype=np.int32)    # stack of roots of the blocks that are yet to be laid out
+    cdef int[::1] queue = np.empty(blockSize, dtype=np.int32)   # BFS inside a block
+    cdef int[::1] depth = np.empty(blockSize, dtype=np.int32)
+    cdef int[::1] below = np.empty(blockSize + 1, dtype=np.int32)               # roots of the blocks below the current block
+    cdef int[::1] newIndex = np.empty(nodes.shape[0], dtype=np.int32)
+    cdef int[:, ::1] oldNodeRows = nodes.copy()
+    cdef Node* old = <Node*> &oldNodeRows[0, 0]
+    cdef unsigned char[::1] oldValue = value.copy()
+    cdef Py_ssize_t count = 0, top = 1, head, tail, numBelow, p, b
+    cdef int node, d, child, c, o
+    blocks[0] = root
+    with nogil:
+        while top > 0:
+            top -= 1
+            queue[0], depth[0] = blocks[top], 0
+            head, tail, numBelow = 0, 1, 0
+            while head < tail:
+                node, d = queue[head], depth[head]
+                head += 1
+                order[count] = node
+                count += 1
+                for c in range(2):
+                    child = n[node].left if c == 0 else n[node].right
+                    if child == NIL:
+                        continue
+                    if d + 1 < height:
+                        queue[tail], depth[tail] = child, d + 1
+                        tail += 1
+                    else:
+                        below[numBelow] = child
+                        numBelow += 1
+            for b in range(numBelow - 1, -1, -1):               # reversed, so that the leftmost block is laid out first
+                blocks[top] = below[b]
+                top += 1
+
+        newIndex[NIL] = NIL
+        for p in range(num):
+            newIndex[order[p]] = p + 1
+        for p in range(num):
+            o = order[p]
+            n[p + 1].left = newIndex[old[o].left]
+            n[p + 1].right = newIndex[old[o].right]
+            n[p + 1].size = old[o].size
+            value[p + 1] = oldValue[o]
+    return newIndex[root]
+
+
+def levelOrder(int[:, ::1] nodes, int root, int[::1] queue):
+    """See _levelOrder_nb() in rope_data_structure.py."""
+    cdef Node* n = <Node*> &nodes[0, 0]
+    cdef Py_ssize_t head = 0, tail = 1
+    cdef int current
+    if root == NIL:
+        return
+    queue[0] = root
+    with nogil:
+        while head < tail:
+            current = queue[head]
+            head += 1
+            if n[current].left != NIL:
+                queue[tail] = n[current].left
+                tail += 1
+            if n[current].right != NIL:
+                queue[tail] = n[current].right
+                tail += 1
@@ -0,0 +1,53 @@
+"""
+Ahead-of-time compilation of the splay tree kernels from rope_data_structure.py, with Numba's pycc.
+
+With Numba's JIT, the kernels are compiled (or loaded from Numba's cache) in every run, before
+the first operation, and importing Numba takes time of its own. This compiles them once, into
+the extension module rope_kernels, which rope_data_structure.py uses instead of the *_nb kernels
+if it can import it. It doesn't need Numba at run time.
+Nodes are always int32, like the node arrays, and ranks and operations are always int64,
+so every kernel has a single signature. _updateSize_nb() is inlined into the others, so it isn't exported.
+
+Build it in place, next to rope_data_structure.py (it needs Numba and a C compiler):
+python compile_kernels.py
+Importing numba.pycc issues a NumbaPendingDeprecationWarning; pycc still works, but Numba is going to replace it.
+"""
+
+import glob
+import os
+
+from numba.pycc import CC
+
+OUTPUT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+for build in glob.glob(os.path.join(OUTPUT_DIR, "rope_kernels.*")):
+    os.remove(build)                                            # the previous build, which is about to be replaced; rope_data_structure would use it instead of the kernels below
+
+import rope_data_structure as rope
+
+assert rope.rope_kernels is None, "rope_data_structure has to use its own kernels, and not another build of rope_kernels"
+
+
+NODES = "i4[:, ::1]"                                            # the nodes array; a row of LEFT, RIGHT and SIZE per node
+PATH = "i4[::1]"
+
+KERNELS = {
+    "orderStatistic": (rope._orderStatistic_nb, "i4({}, {}, i4, i8)".format(NODES, PATH)),
+    "subtreeMaximum": (rope._subtreeMaximum_nb, "i4({}, {}, i4)".format(NODES, PATH)),
+    "merge": (rope._merge_nb, "i4({}, {}, i4, i4)".format(NODES, PATH)),
+    "split": (rope._split_nb, "UniTuple(i4, 2)({}, {}, i4, i8)".format(NODES, PATH)),
+    "processFused": (rope._processFused_nb, "i4({}, {}, i4, i8, i8, i8)".format(NODES, PATH)),
+    "processAll": (rope._processAll_nb, "i4({}, {}, i4, i8[:, :])".format(NODES, PATH)),
+    "build": (rope._build_nb, "i4({}, i4[::1])".format(NODES)),
+    "relayout": (rope._relayout_nb, "i4({}, u1[::1], i4, i8)".format(NODES)),
+    "inOrder": (rope._inOrder_nb, "void({}, i4, i4[::1])".format(NODES)),
+    "inOrderChunk": (rope._inOrderChunk_nb, "i8({}, u1[::1], i4[::1], i8[::1], u1[::1])".format(NODES)),
+    "levelOrder": (rope._levelOrder_nb, "void({}, i4, i4[::1])".format(NODES)),
+}
+
+
+cc = CC("rope_kernels")
+cc.output_dir = OUTPUT_DIR
+for name, (kernel, signature) in KERNELS.items():
+    cc.export(name, signature)(kernel.py_func)                  # the plain Python function; the kernels it calls are compiled along with it
+cc.compile()
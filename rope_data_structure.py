@@ -1,5 +1,22 @@
 import sys
-from collections import deque
+
+import numpy as np
+try:
+    import rope_kernels                                         # the kernels, compiled ahead of time; see compile_kernels.py
+except ImportError:
+    rope_kernels = None
+NUMBA = False
+if rope_kernels is None:                                        # otherwise, Numba isn't needed, and importing it would only slow down the start
+    try:
+        from numba import njit
+        NUMBA = True
+    except ImportError:
+        pass
+if not NUMBA:                                                   # the kernels below run as plain Python functions, or are replaced by their compiled versions
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
 
 """
 *** Rope Data Structure ***
@@ -7,7 +24,7 @@ from collections import deque
 Implementation of a data structure that can store a string and efficiently cut a part
 (a substring) of this string and insert it in a different position.
 This implementation only processes a given string.
-It doesn't support insertion of new characters in the string. 
+It doesn't support insertion of new characters in the string.
 
 https://en.wikipedia.org/wiki/Rope_(data_structure)
 
@@ -15,6 +32,8 @@ Uses Splay tree to implement the Rope data structure
 
 Nodes don't have keys. They only have values. And the value is a character.
 That means that one node contains and represents a single character.
+Characters are ASCII, so a character is a single byte, and ranks count characters (and bytes).
+Other characters are rejected, instead of being split into several nodes, one per byte of their UTF-8 encoding.
 This data structure is about strings. The string represents (is) contents of a text document.
 In a string, characters are in order, of course. The order is represented by their rank. That's why we use
 order statistics to locate a node when searching for it (performing a "find" operation).
@@ -22,10 +41,28 @@ The rank can be seen as their index, and we'll use 0-based indexing.
 The size of a node doesn't have anything to do with its rank. Also, when a node is splayed, its rank doesn't
 change; only its size changes.
 One has to think in terms of node rank, and not in terms of node key, as usual!
-We could also add the field "rank" to Node objects.
+We could also add the field "rank" to nodes.
 But, that's not needed. In-order traversal gives all characters in order.
 
-Works in Python 2 & 3.
+Nodes are not Python objects. The tree is stored in NumPy arrays: nodes (int32), with a row per node,
+which holds its fields LEFT, RIGHT and SIZE next to each other, and value (uint8). A node is an integer
+index into these arrays, and NIL plays the role of None. This takes a few bytes per node instead of
+a whole Python object, and keeps the nodes close to each other in memory.
+A splay step reads and writes all the link fields of a node at once, so they are packed in one row, and
+a visited node usually costs one cache line, instead of one per field. A row is 12 bytes, so 2 out of
+every 16 rows straddle a line boundary and cost two. value is only read when the string is written out,
+so it is kept apart, and doesn't take space in the cache lines of the splay traversal.
+The characters never change, only their positions do. So, value is a fixed byte string indexed by node,
+which holds the characters of the built string in their original order.
+NIL is node 0, a permanent sentinel node of size 0. Real nodes start from index 1.
+That way, a missing child can be indexed like any other node, so sizes are updated without checking
+for a missing child first.
+Nodes don't have parent pointers. They aren't needed, since splaying is done top-down,
+in the same pass as the search for the node.
+
+Works in Python 3. Requires NumPy. If the kernels are compiled ahead of time (compile_kernels.py),
+the compiled module is used. Otherwise, if Numba is installed, the splay tree kernels are compiled with it,
+and if it isn't, but the Cython port of the kernels (_splay.pyx) is built, that is used instead.
 """
 
 """
@@ -33,193 +70,509 @@ MIT License
 Copyright (c) 2017 Ivan Lazarevic
 """
 
-class Node(object):
+NIL = 0                                                         # index of the sentinel node; plays the role of None
+LEFT, RIGHT, SIZE = 0, 1, 2                                     # columns of the nodes array
+NUM_FIELDS = 3
+BLOCK_HEIGHT = 4                                                # 15 nodes; 180 bytes of rows, so a block spans three or four 64-byte cache lines
 
-    def __init__(self, value):
-        self.value = value
-        self.parent = None
-        self.left = None
-        self.right = None
-        self.size = 1
 
-    def printNode(self):
-        print ("Value: {}, Size: {}; Parent: {}, Left child: {}, Right child: {}").format(self.value, self.size, self.parent, self.left, self.right)
+"""
+Kernels
+The hot path of the splay tree (splaying, order statistics) is implemented as module-level
+functions over the node arrays, and not as methods, so that Numba can compile them into tight integer loops.
+Nodes are indices and NIL takes place of None, so there is no Python object or attribute access involved.
+The SplayTree class is a thin wrapper around them.
+"""
 
-    def __str__(self):
-        return "({}, {})".format(self.value, self.size)
+@njit(inline='always')
+def _updateSize_nb(nodes, node):
+    """Recomputes size of a node from sizes of its children."""
+    nodes[node, SIZE] = nodes[nodes[node, LEFT], SIZE] + nodes[nodes[node, RIGHT], SIZE] + 1      # nodes[NIL, SIZE] == 0
 
-    def __repr__(self):
-        return "Value: {}; Size: {}".format(self.value, self.size)
 
+@njit(cache=True)
+def _orderStatistic_nb(nodes, path, root, k):
+    """
+    Input: Root of a tree; integer number k - the rank of a node (0 <= k < size of the tree).
+    Output: The k-th smallest node in the tree. Counting starts from 0.
+    Splays the found node to the top of the tree, so it is the new root.
+    This is top-down splaying (Sleator & Tarjan): the search and the splay are done in a single pass down.
+    Nodes that are passed on the way are hung, with their subtrees, into two temporary trees: those smaller
+    than the node go to the left tree L (along its right spine), and those greater than it go to the right
+    tree R (along its left spine), rotating first on a zig-zig. When the node is reached, its subtrees are
+    hung at the ends of L and R, which become its new subtrees.
+    Sizes of nodes on the two spines are only known then, so the spines are recorded in path
+    (L from the front, R from the back), and their sizes are recomputed bottom-up at the end.
+    path is scratch space, at least as long as the tree is deep.
+    """
+    if root == NIL:
+        return NIL
+    t = root
+    lTail = rTail = np.int32(NIL)                               # last nodes hung into L and R; L's right and R's left child is dangling
+    lRoot = rRoot = np.int32(NIL)                               # typed as a node, and not as the literal 0, which Numba can't unify with nodes in every case
+    lCount = 0
+    rEnd = path.shape[0]                                        # R's spine is path[rEnd:]
+    while True:
+        s = nodes[nodes[t, LEFT], SIZE]
+        if k < s:
+            y = nodes[t, LEFT]
+            if k < nodes[nodes[y, LEFT], SIZE]:
+                # Zig-zig: rotate right
+                nodes[t, LEFT] = nodes[y, RIGHT]
+                nodes[y, RIGHT] = t
+                nodes[t, SIZE] = nodes[nodes[t, LEFT], SIZE] + nodes[nodes[t, RIGHT], SIZE] + 1
+                t = y
+            # Link right
+            if rTail == NIL:
+                rRoot = t
+            else:
+                nodes[rTail, LEFT] = t
+            rTail = t
+            rEnd -= 1
+            path[rEnd] = t
+            t = nodes[t, LEFT]
+        elif k > s:
+            y = nodes[t, RIGHT]
+            if k - s - 1 > nodes[nodes[y, LEFT], SIZE]:
+                # Zig-zig: rotate left
+                nodes[t, RIGHT] = nodes[y, LEFT]
+                nodes[y, LEFT] = t
+                nodes[t, SIZE] = nodes[nodes[t, LEFT], SIZE] + nodes[nodes[t, RIGHT], SIZE] + 1
+                t = y
+            # Link left
+            k -= nodes[nodes[t, LEFT], SIZE] + 1
+            if lTail == NIL:
+                lRoot = t
+            else:
+                nodes[lTail, RIGHT] = t
+            lTail = t
+            path[lCount] = t
+            lCount += 1
+            t = nodes[t, RIGHT]
+        else:
+            break
+
+    # Reassemble
+    if lTail != NIL:
+        nodes[lTail, RIGHT] = nodes[t, LEFT]
+        nodes[t, LEFT] = lRoot
+    if rTail != NIL:
+        nodes[rTail, LEFT] = nodes[t, RIGHT]
+        nodes[t, RIGHT] = rRoot
+    for p in range(lCount - 1, -1, -1):                         # bottom-up
+        _updateSize_nb(nodes, path[p])
+    for p in range(rEnd, path.shape[0]):
+        _updateSize_nb(nodes, path[p])
+    _updateSize_nb(nodes, t)
+    return t
+
+
+@njit(cache=True)
+def _subtreeMaximum_nb(nodes, path, node):
+    """
+    Input: A node in the tree.
+    Returns the node with maximum rank in the subtree rooted at node.
+    Splays the found node to the top of the tree.
+    """
+    if node == NIL:
+        return NIL
+    return _orderStatistic_nb(nodes, path, node, nodes[node, SIZE] - 1)
 
 
-class SplayTree(object):
+@njit(cache=True)
+def _merge_nb(nodes, path, root1, root2):
+    """Merges two trees, given by their roots root1 and root2, using the last node (of highest rank) in
+    the first tree (left string) as the node for merging. Either tree may be empty (NIL).
+    Returns root of the merged tree.
+    """
+    if root1 == NIL:
+        return root2
+    if root2 == NIL:
+        return root1
+    if nodes[root1, RIGHT] != NIL:                              # otherwise, the root is already the maximum (as it is right after _split_nb()), and there's nothing to splay
+        root1 = _subtreeMaximum_nb(nodes, path, root1)
+    nodes[root1, RIGHT] = root2
+    _updateSize_nb(nodes, root1)
+    return root1
+
+
+@njit(cache=True)
+def _split_nb(nodes, path, root, rank):
+    """Splits a tree, given by its root, into two trees.
+    Input: root of a tree; rank of a node (counting starts from 0; 0 <= rank < size of the tree).
+    Returns roots of the two trees, one with nodes with rank <= "rank", the other with nodes with rank > "rank".
+    The second one may be empty (NIL).
+    """
+    root1 = _orderStatistic_nb(nodes, path, root, rank)
+    root2 = nodes[root1, RIGHT]
+    nodes[root1, RIGHT] = NIL                                   # so, root1 is the maximum of the first tree, and _merge_nb() won't have to look for it
+    _updateSize_nb(nodes, root1)
+    return root1, root2
+
+
+@njit(cache=True)
+def _processFused_nb(nodes, path, root, i, j, k):
+    """Cut-and-paste on a tree given by its root; see process().
+    Instead of three splits and three merges, it isolates the substring by splaying its two neighbours,
+    the node of rank i - 1 to the root, and the node of rank j + 1 to the top of the right subtree,
+    so that the substring is exactly the left subtree of the latter. The two remaining parts are linked
+    back together without any splaying, since the first one has its maximum at its root and the second one
+    has its minimum at its root. The substring is pasted in the same way, between the nodes of rank k - 1 and k.
+    That's at most four splays per operation, instead of six.
+    Returns the new root of the tree.
+    """
+    # Cut out the substring [i..j] as "middle".
+    if i > 0:
+        leftRoot = _orderStatistic_nb(nodes, path, root, i - 1)
+        rightRoot = nodes[leftRoot, RIGHT]
+        nodes[leftRoot, RIGHT] = NIL
+    else:
+        leftRoot = np.int32(NIL)                                # typed as a node; see _orderStatistic_nb()
+        rightRoot = root
+    if j - i + 1 < nodes[rightRoot, SIZE]:
+        rightRoot = _orderStatistic_nb(nodes, path, rightRoot, j - i + 1)
+        middle = nodes[rightRoot, LEFT]
+        nodes[rightRoot, LEFT] = NIL
+        _updateSize_nb(nodes, rightRoot)
+    else:
+        middle = rightRoot
+        rightRoot = np.int32(NIL)
+
+    # Link the rest; leftRoot has no right child, rightRoot has no left child.
+    if leftRoot != NIL:
+        nodes[leftRoot, RIGHT] = rightRoot
+        _updateSize_nb(nodes, leftRoot)
+        root = leftRoot
+    else:
+        root = rightRoot
+    if root == NIL:
+        return middle
 
-    def __init__(self):
-        """Creates an empty splay tree."""
-        self.root = None
-        self.size = 0
+    # Paste "middle" after the k-th character of the rest.
+    if k > 0:
+        root = _orderStatistic_nb(nodes, path, root, k - 1)
+        after = nodes[root, RIGHT]
+        if after == NIL:
+            nodes[root, RIGHT] = middle
+            _updateSize_nb(nodes, root)
+            return root
+        after = _orderStatistic_nb(nodes, path, after, 0)
+        nodes[after, LEFT] = middle
+        _updateSize_nb(nodes, after)
+        nodes[root, RIGHT] = after
+        _updateSize_nb(nodes, root)
+        return root
+    root = _orderStatistic_nb(nodes, path, root, 0)
+    nodes[root, LEFT] = middle
+    _updateSize_nb(nodes, root)
+    return root
+
+
+@njit(cache=True)
+def _processAll_nb(nodes, path, root, ops):
+    """Performs all the cut-and-paste operations, given as rows (i, j, k) of the array ops, one after another,
+    without going back to Python between them.
+    Returns the new root of the tree.
+    """
+    for op in range(ops.shape[0]):
+        root = _processFused_nb(nodes, path, root, ops[op, 0], ops[op, 1], ops[op, 2])
+    return root
 
-    def inOrder(self):                                          # Iterative
-        current = self.root
-        if not current:
-            return "".join([])
-        self.result = []                                        # strings are immutable objects in python, therefore appending to them always creates a new string object, which is way too slow
-        stack = []                                              # stack contains nodes
-        while True:
-            while current:
-                stack.append(current)
-                current = current.left
-            if stack:
-                current = stack.pop()
-                self.result.append(current.value)
-                current = current.right
-            else:
-                return "".join(self.result)
 
-    def levelOrder(self):                                       # Breadth First Search
-        root = self.root
-        if not root:
-            return []
-        self.result = []
-        queue = deque([root])                                   # queue contains nodes
-        while queue:
-            current = queue.popleft()
-            self.result.append(current)
-            if current.left:
-                queue.append(current.left)
-            if current.right:
-                queue.append(current.right)
-        return self.result
-
-    def _rotateRight(self, node):
-        """Input: A node object that we want to rotate right.
-           Returns nothing.
-           Doesn't splay any node.
-        """
-        parent = node.parent
-        Y = node.left
-        if not Y:
-            return None                                         # we can't rotate the node with nothing!
-        B = Y.right
-        Y.parent = parent
-        if parent:
-            if node == parent.left:                             # node is left child
-                parent.left = Y
-            else:                                               # node is right child
-                parent.right = Y
+@njit(cache=True)
+def _build_nb(nodes, ranked):
+    """
+    Input: An array of nodes, in order of their rank.
+    Links them into a perfectly balanced tree: the middle node of a range of nodes becomes the root
+    of the subtree that holds the range, and the two halves of the range become its left and right subtree.
+    Only the fields in nodes are overwritten, so the nodes may already be in a tree.
+    Uses an explicit stack instead of recursion. Each node is visited only once, so it takes O(n) time.
+    Returns root of the tree.
+    """
+    n = ranked.shape[0]
+    if n == 0:
+        return NIL
+    stackLo = np.empty(64, dtype=np.int64)                      # the depth of the tree is at most 32, and so is the stack
+    stackHi = np.empty(64, dtype=np.int64)                      # a range is [lo, hi)
+    stackLo[0], stackHi[0] = 0, n
+    top = 1
+    while top > 0:
+        top -= 1
+        lo, hi = stackLo[top], stackHi[top]
+        mid = (lo + hi) // 2
+        node = ranked[mid]
+        nodes[node, SIZE] = hi - lo
+        if lo < mid:
+            nodes[node, LEFT] = ranked[(lo + mid) // 2]         # root of the left half is its middle node
+            stackLo[top], stackHi[top] = lo, mid
+            top += 1
         else:
-            self.root = Y
-
-        node.parent = Y
-        Y.right = node
-        if B:
-            B.parent = node
-        node.left = B
-
-        node.size = (node.left.size if node.left else 0) + (node.right.size if node.right else 0) + 1
-        Y.size = (Y.left.size if Y.left else 0) + (Y.right.size if Y.right else 0) + 1
-
-    def _rotateLeft(self, node):
-        """Input: A node object that we want to rotate left.
-           Returns nothing.
-           Doesn't splay any node.
-        """
-        parent = node.parent
-        X = node.right
-        if not X:
-            return None                                         # we can't rotate the node with nothing!
-        B = X.left
-        X.parent = parent
-        if parent:
-            if node == parent.left:                             # node is left child
-                parent.left = X
-            else:                                               # node is right child
-                parent.right = X
+            nodes[node, LEFT] = NIL
+        if mid + 1 < hi:
+            nodes[node, RIGHT] = ranked[(mid + 1 + hi) // 2]
+            stackLo[top], stackHi[top] = mid + 1, hi
+            top += 1
         else:
-            self.root = X
-
-        node.parent = X
-        X.left = node
-        if B:
-            B.parent = node
-        node.right = B
+            nodes[node, RIGHT] = NIL
+    return ranked[n // 2]
 
-        node.size = (node.left.size if node.left else 0) + (node.right.size if node.right else 0) + 1
-        X.size = (X.left.size if X.left else 0) + (X.right.size if X.right else 0) + 1
 
-    def _splay(self, node):
+@njit(cache=True)
+def _relayout_nb(nodes, value, root, height):
+    """
+    Moves the nodes of the tree given by its root, so that the nodes close to each other in the tree
+    are close to each other in memory as well.
+    The tree is cut into blocks, which are subtrees of the given height (2^height - 1 nodes), starting from
+    the root. Nodes of a block are stored next to each other, in BFS order, and the blocks hanging below
+    a block follow it depth-first, which is one level of the (cache-oblivious) van Emde Boas layout.
+    A root-to-node walk then touches the three or four cache lines of a block (see BLOCK_HEIGHT) for every
+    BLOCK_HEIGHT nodes on its way, instead of a line or two per node.
+    All the allocated nodes have to be in the tree. Nodes get new indices, from 1 on, in that order.
+    Returns the new root of the tree.
+    """
+    n = nodes[root, SIZE]
+    order = np.empty(n, dtype=np.int32)                         # order[p] is the node that goes to index p + 1
+    count = 0
+    blocks = np.empty(n + 1, dtype=np.int32)                    # stack of roots of the blocks that are yet to be laid out
+    blocks[0] = root
+    top = 1
+    blockSize = (1 << height) - 1
+    queue = np.empty(blockSize, dtype=np.int32)                 # BFS inside a block
+    depth = np.empty(blockSize, dtype=np.int32)
+    below = np.empty(blockSize + 1, dtype=np.int32)             # roots of the blocks below the current block
+    while top > 0:
+        top -= 1
+        queue[0], depth[0] = blocks[top], 0
+        head, tail, numBelow = 0, 1, 0
+        while head < tail:
+            node, d = queue[head], depth[head]
+            head += 1
+            order[count] = node
+            count += 1
+            for child in (nodes[node, LEFT], nodes[node, RIGHT]):
+                if child == NIL:
+                    continue
+                if d + 1 < height:
+                    queue[tail], depth[tail] = child, d + 1
+                    tail += 1
+                else:
+                    below[numBelow] = child
+                    numBelow += 1
+        for b in range(numBelow - 1, -1, -1):                   # reversed, so that the leftmost block is laid out first
+            blocks[top] = below[b]
+            top += 1
+
+    newIndex = np.empty(nodes.shape[0], dtype=np.int32)
+    newIndex[NIL] = NIL
+    for p in range(n):
+        newIndex[order[p]] = p + 1
+    oldNodes, oldValue = nodes.copy(), value.copy()
+    for p in range(n):
+        old, new = order[p], p + 1
+        nodes[new, LEFT] = newIndex[oldNodes[old, LEFT]]
+        nodes[new, RIGHT] = newIndex[oldNodes[old, RIGHT]]
+        nodes[new, SIZE] = oldNodes[old, SIZE]
+        value[new] = oldValue[old]
+    return newIndex[root]
+
+
+@njit(cache=True)
+def _inOrder_nb(nodes, root, ranked):
+    """Iterative in-order traversal of the tree given by its root.
+    Writes the nodes, in order of their rank, into the array ranked, which has to be of the size of the tree.
+    Returns nothing.
+    """
+    stack = np.empty(ranked.shape[0], dtype=np.int32)           # stack contains nodes; it's never deeper than the tree
+    top = 0
+    count = 0
+    current = root
+    while True:
+        while current != NIL:
+            stack[top] = current
+            top += 1
+            current = nodes[current, LEFT]
+        if top == 0:
+            return
+        top -= 1
+        current = stack[top]
+        ranked[count] = current
+        count += 1
+        current = nodes[current, RIGHT]
+
+
+@njit(cache=True)
+def _inOrderChunk_nb(nodes, value, stack, state, buf):
+    """Resumable iterative in-order traversal of a tree; see SplayTree.writeInOrder().
+    Writes the characters of the nodes, in order of their rank, into the array buf, until it's full,
+    or until the traversal is over. stack has to be at least as large as the tree is deep.
+    state holds the top of the stack and the current node, (0, root) at the start. They are kept,
+    together with the stack, between calls, so the next call goes on from where this one stopped.
+    Returns the number of characters written into buf, which is less than its size only at the end.
+    """
+    top, current = state[0], state[1]
+    count = 0
+    while count < buf.shape[0]:
+        while current != NIL:
+            stack[top] = current
+            top += 1
+            current = nodes[current, LEFT]
+        if top == 0:
+            break
+        top -= 1
+        current = stack[top]
+        buf[count] = value[current]
+        count += 1
+        current = nodes[current, RIGHT]
+    state[0], state[1] = top, current
+    return count
+
+
+@njit(cache=True)
+def _levelOrder_nb(nodes, root, queue):
+    """Breadth First Search of the tree given by its root.
+    Writes the nodes, in level order, into the array queue, which has to be of the size of the tree.
+    Every node enters the queue only once, so the output array itself is the queue: it's read at head and written at tail.
+    Returns nothing.
+    """
+    if root == NIL:
+        return
+    queue[0] = root
+    head, tail = 0, 1
+    while head < tail:
+        current = queue[head]
+        head += 1
+        if nodes[current, LEFT] != NIL:
+            queue[tail] = nodes[current, LEFT]
+            tail += 1
+        if nodes[current, RIGHT] != NIL:
+            queue[tail] = nodes[current, RIGHT]
+            tail += 1
+
+
+if rope_kernels is not None:
+    _orderStatistic_nb = rope_kernels.orderStatistic
+    _subtreeMaximum_nb = rope_kernels.subtreeMaximum
+    _merge_nb = rope_kernels.merge
+    _split_nb = rope_kernels.split
+    _processFused_nb = rope_kernels.processFused
+    _processAll_nb = rope_kernels.processAll
+    _build_nb = rope_kernels.build
+    _relayout_nb = rope_kernels.relayout
+    _inOrder_nb = rope_kernels.inOrder
+    _inOrderChunk_nb = rope_kernels.inOrderChunk
+    _levelOrder_nb = rope_kernels.levelOrder
+elif not NUMBA:
+    try:
+        import _splay                                           # Cython port of the hot kernels; see _splay.pyx
+    except ImportError:
+        pass
+    else:
+        _orderStatistic_nb = _splay.orderStatistic
+        _subtreeMaximum_nb = _splay.subtreeMaximum
+        _processFused_nb = _splay.processFused
+        _processAll_nb = _splay.processAll
+        _inOrder_nb = _splay.inOrder
+        _build_nb = _splay.build
+        _inOrderChunk_nb = _splay.inOrderChunk
+        _merge_nb = _splay.merge
+        _split_nb = _splay.split
+        _relayout_nb = _splay.relayout
+        _levelOrder_nb = _splay.levelOrder
+
+
+class SplayTree:
+
+    def __init__(self, capacity = 16):
+        """Creates an empty splay tree.
+           capacity is the number of nodes that we expect to allocate; arrays are preallocated for them.
+           If we allocate more nodes than that, the arrays double in size.
         """
-        Splays node to the top of the tree, making it new root of the tree.
-        When we splay a node, it will keep its rank; but, it will have a new size.
-        Returns nothing.
+        capacity = capacity + 1                                 # one more for the sentinel; fields of other nodes are initialized when they are allocated
+        self.value = np.empty(capacity, dtype=np.uint8)         # characters, as bytes
+        self.nodes = np.empty((capacity, NUM_FIELDS), dtype=np.int32)           # a row per node: its LEFT, RIGHT and SIZE (of the subtree rooted at it)
+        self.path = np.empty(capacity, dtype=np.int32)          # not a node field; scratch space for splaying, see _orderStatistic_nb()
+        self.value[NIL] = 0                                     # the sentinel
+        self.nodes[NIL] = (NIL, NIL, 0)
+        self.count = 1                                          # number of allocated nodes, including the sentinel
+        self.root = NIL
+        self._opsSinceRebalance = 0
+
+    def __len__(self):
+        """Returns the size of the whole tree (the length of the string)."""
+        return int(self.nodes[self.root, SIZE])                 # nodes[NIL, SIZE] == 0
+
+    def _grow(self):
+        """Doubles the capacity of the node arrays. Allocated nodes keep their indices."""
+        capacity = 2 * len(self.value)
+        for name in ("value", "nodes", "path"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _alloc(self, value):
+        """Input: value is an ASCII character, either as a one-character string or as its byte value (an int).
+           Allocates a new single node (of size 1) with character "value".
+           Returns index of the new node. The node isn't linked into the tree.
         """
-        if not node:
-            return
-
-        parent = node.parent
-
-        while parent:
+        if self.count == len(self.value):
+            self._grow()
+        node = self.count
+        self.count += 1
+        code = ord(value) if isinstance(value, str) else value
+        assert 0 <= code < 128, "a character has to be ASCII"
+        self.value[node] = code
+        self.nodes[node] = (NIL, NIL, 1)
+        return node
 
-            left = node.left
-            right = node.right
-            grandParent = parent.parent
+    def printNode(self, node):
+        print("Value: {}, Size: {}; Left child: {}, Right child: {}".format(chr(self.value[node]), self.nodes[node, SIZE], self.nodes[node, LEFT], self.nodes[node, RIGHT]))
 
-            if not grandParent:
-                # Zig
-                if node == parent.left:
-                    self._rotateRight(parent)
-                else:
-                    self._rotateLeft(parent)
+    def inOrder(self):                                          # Iterative
+        """Returns the string that the tree holds.
+           The traversal only collects nodes, in order, into an array. Characters never move between nodes,
+           so value is a fixed byte string indexed by node, and the whole string is then gathered from it at once.
+        """
+        ranked = np.empty(len(self), dtype=np.int32)            # nodes in order of their rank
+        _inOrder_nb(self.nodes, self.root, ranked)
+        return self.value[ranked].tobytes().decode('ascii')
+
+    def writeInOrder(self, fileobj, chunkSize = 65536):     # Iterative
+        """Input: A binary file object fileobj (such as sys.stdout.buffer); the size of a chunk, in bytes.
+           Writes the string that the tree holds into fileobj, as bytes, one chunk at a time.
+           Unlike inOrder(), it never builds the whole string, or the array of all the nodes in order.
+           The traversal fills a buffer of chunkSize bytes, which is written out whenever it's full,
+           and then goes on from where it stopped; see _inOrderChunk_nb().
+           Returns nothing.
+        """
+        buf = np.empty(chunkSize, dtype=np.uint8)
+        stack = np.empty(len(self), dtype=np.int32)             # np.empty doesn't touch the memory, so only as much of it as the tree is deep is ever used
+        state = np.array([0, self.root], dtype=np.int64)
+        while True:
+            count = _inOrderChunk_nb(self.nodes, self.value, stack, state, buf)
+            fileobj.write(buf[:count])
+            if count < chunkSize:
+                return
 
-            elif node == parent.left:
-                if parent == grandParent.left:
-                    # Zig-zig
-                    self._rotateRight(grandParent)
-                    self._rotateRight(parent)
-                else:
-                    # Zig-zag (parent == grandParent.right)
-                    self._rotateRight(parent)
-                    self._rotateLeft(grandParent)
-
-            elif node == parent.right:
-                if parent == grandParent.right:
-                    # Zig-zig
-                    self._rotateLeft(grandParent)
-                    self._rotateLeft(parent)
-                else:
-                    # Zig-zag (parent == grandParent.left)
-                    self._rotateLeft(parent)
-                    self._rotateRight(grandParent)
+    def levelOrder(self):                                       # Breadth First Search
+        """Returns an array of all the nodes, in level order."""
+        queue = np.empty(len(self), dtype=np.int32)
+        _levelOrder_nb(self.nodes, self.root, queue)
+        return queue
 
-            parent = node.parent
+    def _updateSize(self, node):
+        """Recomputes size of a node from sizes of its children."""
+        _updateSize_nb(self.nodes, node)
 
     def orderStatisticZeroBasedRanking(self, k):
         """
         Input: Integer number k - the rank of a node (0 <= k < size of the whole tree).
-        Output: The k-th smallest element in the tree (a node object). Counting starts from 0.
+        Output: The k-th smallest element in the tree (a node index). Counting starts from 0.
         This is a public method, which splays the found node to the top of the tree.
         """
-        assert 0 <= k < self.size, "0 <= k < size of the whole tree"
-        node = self.root
-        while node:
-            left, right = node.left, node.right
-            s = left.size if left else 0
-            if k == s:
-                break
-            elif k < s:
-                if left:
-                    node = left
-                    continue
-                break
-            else:
-                if right:
-                    k = k - s - 1
-                    node = right
-                    continue
-                break
-        self._splay(node)
-        return node
+        assert 0 <= k < len(self), "0 <= k < size of the whole tree"
+        self.root = _orderStatistic_nb(self.nodes, self.path, self.root, k)
+        return self.root
 
     """We don't use key. We instead use rank as the position at which to insert a letter (node).
     """
@@ -228,40 +581,94 @@ class SplayTree(object):
            This is a general splay tree method, that works in general case.
            Adds a node with letter "value" to the tree (string), at the position "rank". Numbering is 0-based.
            Splays the node up to the top of the tree.
-           But, if we insert more than one character at one time (a string), it will also work. It will accept a string, and put it in a node.
+           A node holds a single character (a byte).
            Returns nothing.
            Goes down from root to a leaf only once, and also goes up only once.
         """
-        assert 0 <= rank <= self.size, "0 <= rank <= size of the whole tree"
+        n = len(self)
+        assert 0 <= rank <= n, "0 <= rank <= size of the whole tree"
+
+        node = self._alloc(value)
+        nodes = self.nodes
 
-        node = Node(value)
-        
         # Inserting at the end of the whole text.
-        if rank == self.size and self.size > 0:
+        if rank == n and n > 0:
             last = self.orderStatisticZeroBasedRanking(rank-1)  # Or, subtreeMaximum(self.root)
-            node.left = last
-            node.size = last.size + 1
-            last.parent = node
-            self.size += 1                                      # Tree size
+            nodes[node, LEFT] = last
+            self._updateSize(node)
             self.root = node
             return
 
         # Inserting in the middle (or at the beginning).
-        if self.size == 0:
+        if n == 0:
             # The tree is empty.
-            self.size += 1                                      # Tree size
             self.root = node
             return
-        right = self.orderStatisticZeroBasedRanking(rank)       # This will be right node of the newly inserted node.
-        node.right = right
-        node.left = right.left
-        right.parent = node
-        right.left = None
-        right.size = (right.right.size if right.right else 0) + 1
-        node.size = (node.left.size if node.left else 0) + (node.right.size if node.right else 0) + 1
-        self.size += 1                                          # Tree size
+        nodeRight = self.orderStatisticZeroBasedRanking(rank)   # This will be right node of the newly inserted node.
+        nodes[node, RIGHT] = nodeRight
+        nodes[node, LEFT] = nodes[nodeRight, LEFT]
+        nodes[nodeRight, LEFT] = NIL
+        self._updateSize(nodeRight)
+        self._updateSize(node)
         self.root = node
 
+    def rebalance(self):
+        """Rebuilds the tree as a perfectly balanced tree, in place; see _build_nb().
+           It collects the nodes in order, and links them again, so the string doesn't change.
+           Splaying keeps the tree balanced only on average, and some sequences of operations can
+           make it very deep, so we do this every rebalancePeriod() operations. It takes O(n) time.
+           Returns nothing.
+        """
+        ranked = np.empty(len(self), dtype=np.int32)
+        _inOrder_nb(self.nodes, self.root, ranked)
+        self.root = _build_nb(self.nodes, ranked)
+        self._opsSinceRebalance = 0
+
+    def rebalancePeriod(self):
+        """Returns the number of cut-and-paste operations between two rebalances of the tree: n / log2(n),
+           for a tree of size n. A rebalance takes O(n) time, so that adds only O(log n) time to an operation,
+           amortized, which is what an operation costs anyway.
+        """
+        n = len(self)
+        return max(n // max(n.bit_length() - 1, 1), 1)          # bit_length() - 1 == floor(log2(n))
+
+    def _countOps(self, count):
+        """Counts cut-and-paste operations performed on the tree, and rebalances it every rebalancePeriod() of them."""
+        self._opsSinceRebalance += count
+        if self._opsSinceRebalance >= self.rebalancePeriod():
+            self.rebalance()
+
+    def relayoutVEB(self):
+        """Reorders the node arrays into a blocked van Emde Boas layout; see _relayout_nb().
+           The shape of the tree and the string don't change, but nodes get new indices.
+           All the allocated nodes have to be in this tree, so it can't be split at the moment (see split()).
+           Returns nothing.
+        """
+        assert len(self) == self.count - 1, "all the allocated nodes have to be in the tree"
+        if self.root == NIL:
+            return
+        self.root = _relayout_nb(self.nodes, self.value, self.root, BLOCK_HEIGHT)
+
+    def buildFromString(self, s):
+        """Input: An ASCII string s, either as str or as bytes; bytes are taken as they are, without any copy to a str.
+           Builds the tree out of the whole string s at once, one node per character.
+           The tree has to be empty. The resulting tree is perfectly balanced, unlike the tree that
+           insertSpecific() builds, which is a left-skewed chain; so, first splays are short.
+           Takes O(n) time.
+           Returns nothing.
+        """
+        assert self.root == NIL, "the tree has to be empty"
+        if isinstance(s, str):
+            s = s.encode('ascii')                               # raises UnicodeEncodeError for other characters
+        assert s.isascii(), "the string has to be ASCII"
+        n = len(s)
+        while self.count + n > len(self.value):
+            self._grow()
+        first = self.count
+        self.value[first:first + n] = np.frombuffer(s, dtype=np.uint8)
+        self.count += n
+        self.root = _build_nb(self.nodes, np.arange(first, first + n, dtype=np.int32))
+
     def insertSpecific(self, value):
         """Input: value is a lowercase English letter.
            This is a specific method, that doesn't work in general case of a splay tree.
@@ -270,68 +677,43 @@ class SplayTree(object):
            Adds a node with letter "value" to the tree, as the new root of the tree.
            Returns nothing.
         """
-        node = Node(value)
-        if self.root:
-            self.root.parent = node
-        node.left = self.root
-        node.size = (node.left.size if node.left else 0) + 1
+        node = self._alloc(value)
+        self.nodes[node, LEFT] = self.root
+        self._updateSize(node)
         self.root = node
-        self.size += 1
 
     def subtreeMaximum(self, node):
         """
-        Input: Node object in the tree.
-        Returns the node object with maximum rank in the subtree rooted at node.
+        Input: A node in the tree.
+        Returns the node with maximum rank in the subtree rooted at node.
         Splays the found node to the top of the tree.
         """
-        if not node:
-            return None
-        while node.right:
-            node = node.right
-        self._splay(node)
-        return node
+        if node == NIL:
+            return NIL
+        self.root = _subtreeMaximum_nb(self.nodes, self.path, node)
+        return self.root
 
 
 
-def merge(tree1, tree2):
-    """Merges two Splay trees, tree1 and tree2, using the last element (of highest rank) in tree1 (left string) as the node for merging, into a new Splay tree.
+def merge(tree, root1, root2):
+    """Merges two trees, using the last element (of highest rank) in the first one (left string) as the node for merging, into a new tree.
     CONSTRAINTS: None.
-    INPUTS: tree1, tree2.
-    OUTPUT (the return value of this function) is tree1, with all the elements of both trees.
-    USAGE: After this function, we can delete tree2.
+    INPUTS: A Splay tree, whose arrays hold the nodes; roots of the two trees, root1 and root2. Either may be NIL (an empty tree).
+    OUTPUT (the return value of this function) is the root of the new tree, with all the elements of both trees.
+    Trees are just their roots here, so no SplayTree objects are created.
     """
-    if not tree1 or not tree1.size:
-        return tree2
-    if not tree2 or not tree2.size:
-        return tree1
-    root2 = tree2.root
-    root1 = tree1.subtreeMaximum(tree1.root)
-    root2.parent = root1
-    root1.right = root2
-    root1.size = (root1.left.size if root1.left else 0) + (root1.right.size if root1.right else 0) + 1
-    tree1.size = root1.size
-    return tree1
-
-
-def split(tree, rank):
+    return _merge_nb(tree.nodes, tree.path, root1, root2)
+
+
+def split(tree, root, rank):
     """
-    Splits Splay tree into two trees.
-    Input: A Splay tree; rank of a node (counting starts from 0; 0 <= rank < size of the whole tree).
-    Output: Two Splay trees, one with elements with rank <= "rank", the other with elements with rank > "rank".
+    Splits a tree into two trees.
+    Input: A Splay tree, whose arrays hold the nodes; root of the tree to split; rank of a node (counting starts from 0; 0 <= rank < size of the tree).
+    Output: Roots of the two trees, one with elements with rank <= "rank", the other with elements with rank > "rank" (possibly NIL).
+    Trees are just their roots here, so no SplayTree objects are created.
     """
-    root1 = tree.orderStatisticZeroBasedRanking(rank)
-    root2 = root1.right
-    root1.right = None
-    root1.size = (root1.left.size if root1.left else 0) + (root1.right.size if root1.right else 0) + 1
-    tree1 = SplayTree()
-    tree1.root = root1                                          # insertTree()
-    tree1.size = root1.size
-    tree2 = SplayTree()        
-    if root2:
-        root2.parent = None
-        tree2.root = root2                                      # insertTree()
-        tree2.size = root2.size
-    return tree1, tree2
+    assert 0 <= rank < tree.nodes[root, SIZE], "0 <= rank < size of the tree"
+    return _split_nb(tree.nodes, tree.path, root, rank)
 
 
 def process(tree, i, j, k):
@@ -339,33 +721,74 @@ def process(tree, i, j, k):
        For i and j, counting starts from 0; for k, counting starts from 1.
        We paste the substring after the k-th symbol of the remaining string (after cutting).
        If k == 0, we insert the substring at the beginning.
+       Intermediate trees are only roots (integers), and the tree is changed in place.
     """
-    middle, right = split(tree, j)
+    n = len(tree)
+    assert 0 <= i <= j < n and 0 <= k <= n - (j - i + 1), "0 <= i <= j < n and 0 <= k <= n - (j - i + 1)"
+    middle, right = split(tree, tree.root, j)
     if i > 0:
-        left, middle = split(middle, i - 1)
+        left, middle = split(tree, middle, i - 1)
     else:
-        left = None
-    left = merge(left, right)
+        left = NIL
+    left = merge(tree, left, right)
     if k > 0:
-        left, right = split(left, k - 1)
+        left, right = split(tree, left, k - 1)
     else:
         right = left
-        left = None
-    tree = merge(merge(left, middle), right)
+        left = NIL
+    tree.root = merge(tree, merge(tree, left, middle), right)
+    tree._countOps(1)
+    return tree
+
+
+def processFused(tree, i, j, k):
+    """This is cut-and-paste function, which does the same as process(), but with fewer splays,
+       and without splitting the tree into intermediate trees.
+    """
+    n = len(tree)
+    assert 0 <= i <= j < n and 0 <= k <= n - (j - i + 1), "0 <= i <= j < n and 0 <= k <= n - (j - i + 1)"
+    tree.root = _processFused_nb(tree.nodes, tree.path, tree.root, i, j, k)
+    tree._countOps(1)
+    return tree
+
+
+def processAll(tree, ops, numRelayouts = 0):
+    """Performs all the cut-and-paste operations in the array ops, which has a row (i, j, k) for every operation.
+       It's the same as calling processFused() for each row, but the whole loop runs in compiled kernels.
+       Operations are performed in numRelayouts + 1 batches, and the tree is laid out in memory again
+       after each batch but the last one (see SplayTree.relayoutVEB()).
+       It's off by default: relayout takes O(n) time, and splaying scatters the nodes again right after it,
+       so it doesn't pay for itself (1M characters and 200k operations: 0.49 s without it, 0.58 s with 3, 0.70 s with 10).
+       A batch is further cut into chunks at the points where the tree has to be rebalanced.
+       All the operations are checked at once, before any of them is performed; the kernels don't check them.
+    """
+    n = len(tree)
+    i, j, k = ops.reshape(-1, 3).T
+    assert ((0 <= i) & (i <= j) & (j < n) & (0 <= k) & (k <= n - (j - i + 1))).all(), "0 <= i <= j < n and 0 <= k <= n - (j - i + 1) for every operation"
+    period = max(-(-len(ops) // (numRelayouts + 1)), 1)         # rounded up
+    for start in range(0, len(ops), period):
+        if start > 0:
+            tree.relayoutVEB()
+        batch = ops[start:start + period]
+        while len(batch):
+            chunk = batch[:max(tree.rebalancePeriod() - tree._opsSinceRebalance, 1)]
+            tree.root = _processAll_nb(tree.nodes, tree.path, tree.root, chunk)
+            tree._countOps(len(chunk))
+            batch = batch[len(chunk):]
     return tree
 
 
 def printTree(tree, verbose = False):
     """If boolean verbose is True, it will print all nodes, in level order (BFS).
     """
-    print
-    print ("In order:", tree.inOrder())
+    print()
+    print("In order:", tree.inOrder())
     if verbose:
-        print ("Nodes (in level order (BFS)):")
+        print("Nodes (in level order (BFS)):")
         nodes = tree.levelOrder()
         for node in nodes:
-            node.printNode()
-    print
+            tree.printNode(node)
+    print()
 
 
 """
@@ -380,16 +803,18 @@ Constraints:
 0 <= i <= j <= n - 1
 0 <= k <= n - (j - i + 1)
 """
-	
-tree = SplayTree()
-rope = sys.stdin.readline().strip()
-for i in range(len(rope)):
-    #tree.insert(i, rope[i])
-    tree.insertSpecific(rope[i])
-#printTree(tree, True)
-numOps = int(sys.stdin.readline())
-for _ in range(numOps):
-    i, j, k = map(int, sys.stdin.readline().strip().split())
-    tree = process(tree, i, j, k)
-#printTree(tree, True)
-print (tree.inOrder())
+
+if __name__ == "__main__":                                      # so that compile_kernels.py can import the kernels
+    stdin = sys.stdin.buffer                                    # raw bytes; no decoding and no newline translation of the whole input
+    rope = stdin.readline().strip()                             # bytes; the characters go straight into the value array
+    tree = SplayTree(len(rope))                                 # nodes are only allocated while building, so this is the final capacity
+    tree.buildFromString(rope)
+    #printTree(tree, True)
+    numOps = int(stdin.readline())
+    ops = np.fromstring(stdin.read(), dtype=np.int64, sep=" ").reshape(-1, 3)       # all the operations are parsed at once
+    assert len(ops) == numOps, "expected {} operations, got {}".format(numOps, len(ops))
+    tree = processAll(tree, ops)
+    #printTree(tree, True)
+    sys.stdout.flush()                                          # whatever was printed so far goes out before the raw bytes
+    tree.writeInOrder(sys.stdout.buffer)                        # streamed in chunks; the whole string is never built
+    sys.stdout.buffer.write(b"\n")